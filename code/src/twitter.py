@@ -1,18 +1,44 @@
 """
 Author      : Yi-Chieh Wu, Sriram Sankararman
 Description : Twitter
+
+Optional    : scikit-learn-intelex (sklearnex); if installed, its oneDAL
+              kernels are patched into scikit-learn at import time
 """
 
+import re
+from functools import partial
+from itertools import chain, count, filterfalse
 from string import punctuation
 
 import numpy as np
+from scipy.sparse import csr_matrix, issparse
+
+# route supported scikit-learn estimators to oneDAL when sklearnex is available
+try:
+    from sklearnex import patch_sklearn
+    patch_sklearn()
+except ImportError:
+    pass
 
-# !!! MAKE SURE TO USE SVC.decision_function(X), NOT SVC.predict(X) !!!
+# !!! MAKE SURE TO USE LinearSVC.decision_function(X), NOT LinearSVC.predict(X) !!!
 # (this makes ``continuous-valued'' predictions)
-from sklearn.svm import SVC
-from sklearn.model_selection import StratifiedKFold
+from sklearn.svm import LinearSVC
+from sklearn.model_selection import GridSearchCV, StratifiedKFold
 from sklearn import metrics
 
+# a token is either a single punctuation mark or a maximal run of characters
+# that are neither whitespace nor punctuation
+_TOKEN_RE = re.compile(r"[{0}]|[^\s{0}]+".format(re.escape(punctuation)))
+
+# (key, value) pairs are (metric, (score function, whether it takes
+# continuous-valued predictions instead of binary labels))
+_METRICS = {
+    'accuracy': (metrics.accuracy_score, False),
+    'f1_score': (metrics.f1_score, False),
+    'auroc':    (metrics.roc_auc_score, True),
+}
+
 ######################################################################
 # functions -- input/output
 ######################################################################
@@ -27,10 +53,10 @@ def read_vector_file(fname):
 
     Returns
     --------------------
-        labels -- numpy array of shape (n,)
+        labels -- numpy array of shape (n,), dtype int8
                     n is the number of non-blank lines in the text file
     """
-    return np.genfromtxt(fname)
+    return np.loadtxt(fname, dtype=np.int8)
 
 
 ######################################################################
@@ -51,9 +77,7 @@ def extract_words(input_string):
         words        -- list of lowercase "words"
     """
 
-    for c in punctuation :
-        input_string = input_string.replace(c, ' ' + c + ' ')
-    return input_string.lower().split()
+    return _TOKEN_RE.findall(input_string.lower())
 
 
 def extract_dictionary(infile):
@@ -71,14 +95,13 @@ def extract_dictionary(infile):
     """
 
     word_list = {}
+    add = word_list.setdefault
     with open(infile, 'r') as fid :
         ### ========== TODO : START ========== ###
         # part 1a: process each line to populate word_list
         for line in fid:
-            words = extract_words(line)
-            for word in words:
-                if word not in word_list:
-                    word_list[word] = len(word_list)-1
+            for word in extract_words(line):
+                add(word, len(word_list))
         ### ========== TODO : END ========== ###
 
     return word_list
@@ -96,31 +119,114 @@ def extract_feature_vectors(infile, word_list):
 
     Returns
     --------------------
-        feature_matrix -- numpy array of shape (n,d)
-                          boolean (0,1) array indicating word presence in a string
+        feature_matrix -- scipy.sparse.csr_matrix of shape (n,d)
+                          binary (0,1) float32 matrix indicating word presence in a string
                             n is the number of non-blank lines in the text file
                             d is the number of unique words in the text file
     """
 
-    num_lines = sum(1 for line in open(infile,'r'))
-    num_words = len(word_list)
-    feature_matrix = np.zeros((num_lines, num_words))
+    rows = []
 
     with open(infile, 'r') as fid :
         ### ========== TODO : START ========== ###
         # part 1b: process each line to populate feature_matrix
-        for i, line in enumerate(fid):
-            words = set(extract_words(line))
-            for word in words:
-                feature_matrix[i, word_list[word]] = 1
+        for line in fid:
+            rows.append(set(extract_words(line)))
         ### ========== TODO : END ========== ###
-    return feature_matrix
+
+    return _rows_to_csr(rows, word_list)
+
+
+def build_features(infile):
+    """
+    Builds the dictionary of unique words/punctuations and the bag-of-words
+    representation of a text file in a single pass, tokenizing each line once.
+
+    Parameters
+    --------------------
+        infile         -- string, filename
+
+    Returns
+    --------------------
+        word_list      -- dictionary, (key, value) pairs are (word, index)
+        feature_matrix -- scipy.sparse.csr_matrix of shape (n,d)
+                          binary (0,1) float32 matrix indicating word presence in a string
+                            n is the number of non-blank lines in the text file
+                            d is the number of unique words in the text file
+    """
+
+    word_list = {}
+    rows = []
+
+    with open(infile, 'r') as fid :
+        for line in fid:
+            # dedupe while keeping first-seen order, so indices match extract_dictionary
+            words = dict.fromkeys(extract_words(line))
+            # index unseen words in order without a Python-level loop over tokens
+            word_list.update(zip(filterfalse(word_list.__contains__, words),
+                                 count(len(word_list))))
+            rows.append(words)
+
+    return word_list, _rows_to_csr(rows, word_list)
+
+
+def _rows_to_csr(rows, word_list):
+    """
+    Assembles per-line collections of unique words into a binary CSR matrix
+    of shape (len(rows), len(word_list)). All words are mapped to their
+    indices in a single np.fromiter call over the flattened rows.
+    """
+    indptr = np.zeros(len(rows) + 1, dtype=np.int32)
+    np.cumsum(np.fromiter(map(len, rows), dtype=np.int32, count=len(rows)),
+              out=indptr[1:])
+    indices = np.fromiter(map(word_list.__getitem__, chain.from_iterable(rows)),
+                          dtype=np.int32, count=indptr[-1])
+    data = np.ones(len(indices), dtype=np.float32)
+    return csr_matrix((data, indices, indptr), shape=(len(rows), len(word_list)))
 
 
 ######################################################################
 # functions -- evaluation
 ######################################################################
 
+def _score(y_true, y_label, y_pred, metric):
+    """
+    Calculates a single performance metric from known labels and either the
+    binary labels or the (continuous-valued) predictions, as the metric needs.
+    """
+    ### ========== TODO : START ========== ###
+    # part 2a: compute classifier performance
+    entry = _METRICS.get(metric)
+    if entry is None:
+        return 0
+    score_fn, continuous = entry
+    return score_fn(y_true, y_pred if continuous else y_label)
+    ### ========== TODO : END ========== ###
+
+
+def fast_linear_decision(clf, X):
+    """
+    Computes the (continuous-valued) predictions of a fitted linear classifier
+    as a single matrix-vector product with its primal weight vector.
+
+    Parameters
+    --------------------
+        clf    -- classifier (instance of LinearSVC or linear-kernel SVC)
+                    [already fit to data]
+        X      -- numpy array or sparse matrix of shape (n,d), feature vectors
+
+    Returns
+    --------------------
+        y_pred -- numpy array of shape (n,), equivalent to clf.decision_function(X)
+    """
+    # for linear-kernel SVC, coef_ collapses dual_coef_ @ support_vectors_
+    w = clf.coef_
+    if issparse(w):
+        w = w.toarray()
+    w = np.asarray(w).ravel()
+    return np.asarray(X @ w).ravel() + clf.intercept_[0]
+
+
 def performance(y_true, y_pred, metric="accuracy"):
     """
     Calculates the performance metric based on the agreement between the
@@ -131,43 +237,52 @@ def performance(y_true, y_pred, metric="accuracy"):
         y_true -- numpy array of shape (n,), known labels
         y_pred -- numpy array of shape (n,), (continuous-valued) predictions
         metric -- string, option used to select the performance measure
-                  options: 'accuracy', 'f1-score', 'auroc'
+                  options: 'accuracy', 'f1_score', 'auroc'
 
     Returns
     --------------------
         score  -- float, performance score
     """
     # map continuous-valued predictions to binary labels
-    y_label = np.sign(y_pred)
-    y_label[y_label==0] = 1
+    y_label = np.where(y_pred >= 0.0, 1.0, -1.0)
+    return _score(y_true, y_label, y_pred, metric)
 
-    ### ========== TODO : START ========== ###
-    # part 2a: compute classifier performance
-    if metric == 'accuracy':
-        return metrics.accuracy_score(y_true, y_label)
-    elif metric == 'f1_score':
-        return metrics.f1_score(y_true, y_label)
-    elif metric == 'auroc':
-        return metrics.roc_auc_score(y_true, y_label)
-    return 0
-    ### ========== TODO : END ========== ###
+
+def performance_multi(y_true, y_pred, metric_list):
+    """
+    Calculates several performance metrics from a single set of predictions.
+
+    Parameters
+    --------------------
+        y_true      -- numpy array of shape (n,), known labels
+        y_pred      -- numpy array of shape (n,), (continuous-valued) predictions
+        metric_list -- list of strings, options used to select performance measures
+
+    Returns
+    --------------------
+        scores      -- dictionary, (key, value) pairs are (metric, score)
+    """
+    # map continuous-valued predictions to binary labels once for all metrics
+    y_label = np.where(y_pred >= 0.0, 1.0, -1.0)
+    return dict((metric, _score(y_true, y_label, y_pred, metric))
+                for metric in metric_list)
 
 
-def cv_performance(clf, X, y, kf, metric="accuracy"):
+def cv_performance(clf, X, y, folds, metric="accuracy"):
     """
-    Splits the data, X and y, into k-folds and runs k-fold cross-validation.
+    Splits the data, X and y, along the given k folds and runs k-fold cross-validation.
     Trains classifier on k-1 folds and tests on the remaining fold.
     Calculates the k-fold cross-validation performance metric for classifier
     by averaging the performance across folds.
 
     Parameters
     --------------------
-        clf    -- classifier (instance of SVC)
+        clf    -- classifier (instance of LinearSVC)
         X      -- numpy array of shape (n,d), feature vectors
                     n = number of examples
                     d = number of features
         y      -- numpy array of shape (n,), binary labels {1,-1}
-        kf     -- cross_validation.KFold or cross_validation.StratifiedKFold
+        folds  -- list of (train_index, test_index) pairs, e.g. list(kf.split(X, y))
         metric -- string, option used to select performance measure
 
     Returns
@@ -175,20 +290,55 @@ def cv_performance(clf, X, y, kf, metric="accuracy"):
         score   -- float, average cross-validation performance across k folds
     """
 
+    return cv_performance_multi(clf, X, y, folds, [metric])[metric]
+
+
+def cv_performance_multi(clf, X, y, folds, metric_list):
+    """
+    Runs k-fold cross-validation once and calculates the average performance
+    across folds for each of several metrics.
+
+    Parameters
+    --------------------
+        clf         -- classifier (instance of LinearSVC)
+        X           -- numpy array of shape (n,d), feature vectors
+                         n = number of examples
+                         d = number of features
+        y           -- numpy array of shape (n,), binary labels {1,-1}
+        folds       -- list of (train_index, test_index) pairs, e.g. list(kf.split(X, y))
+        metric_list -- list of strings, options used to select performance measures
+
+    Returns
+    --------------------
+        scores      -- dictionary, (key, value) pairs are (metric, average
+                         cross-validation performance across k folds)
+    """
+
     ### ========== TODO : START ========== ###
     # part 2b: compute average cross-validation performance
-    score = 0
-    for train_index, test_index in kf.split(X,y):
+    scores = dict((metric, 0) for metric in metric_list)
+    for train_index, test_index in folds:
         X_train, X_test = X[train_index], X[test_index]
         y_train, y_test = y[train_index], y[test_index]
         clf.fit(X_train, y_train)
-        y_pred = clf.decision_function(X_test)
-        score += performance(y_test, y_pred, metric)
-    return score / kf.get_n_splits()
+        y_pred = fast_linear_decision(clf, X_test)
+        for metric, score in performance_multi(y_test, y_pred, metric_list).items():
+            scores[metric] += score
+    n_splits = len(folds)
+    return dict((metric, score / n_splits) for metric, score in scores.items())
     ### ========== TODO : END ========== ###
 
 
-def select_param_linear(X, y, kf, metric="accuracy"):
+def _multi_scorer(clf, X, y, metric_list):
+    """
+    GridSearchCV scorer that evaluates every metric in metric_list from a
+    single set of (continuous-valued) predictions on a test fold.
+    Defined at module scope so that it can be dispatched to worker processes.
+    """
+    return performance_multi(y, fast_linear_decision(clf, X), metric_list)
+
+
+def select_param_linear(X, y, folds, metric="accuracy"):
     """
     Sweeps different settings for the hyperparameter of a linear-kernel SVM,
     calculating the k-fold CV performance for each setting, then selecting the
@@ -200,7 +350,7 @@ def select_param_linear(X, y, kf, metric="accuracy"):
                     n = number of examples
                     d = number of features
         y      -- numpy array of shape (n,), binary labels {1,-1}
-        kf     -- cross_validation.KFold or cross_validation.StratifiedKFold
+        folds  -- list of (train_index, test_index) pairs, e.g. list(kf.split(X, y))
         metric -- string, option used to select performance measure
 
     Returns
@@ -208,39 +358,74 @@ def select_param_linear(X, y, kf, metric="accuracy"):
         C -- float, optimal parameter value for linear-kernel SVM
     """
 
-    print ('Linear SVM Hyperparameter Selection based on ' + str(metric) + ':')
+    return select_param_linear_all(X, y, folds, [metric])[metric]
+
+
+def select_param_linear_all(X, y, folds, metric_list):
+    """
+    Sweeps different settings for the hyperparameter of a linear-kernel SVM
+    and selects the optimal setting for each of several performance measures.
+    Each (C, fold) pair is fit only once, in parallel via GridSearchCV; its
+    test-fold predictions are reused to score every metric.
+
+    Parameters
+    --------------------
+        X           -- numpy array of shape (n,d), feature vectors
+                         n = number of examples
+                         d = number of features
+        y           -- numpy array of shape (n,), binary labels {1,-1}
+        folds       -- list of (train_index, test_index) pairs, e.g. list(kf.split(X, y))
+        metric_list -- list of strings, options used to select performance measures
+
+    Returns
+    --------------------
+        optimal_c   -- dictionary, (key, value) pairs are (metric, optimal C)
+    """
+
     C_range = 10.0 ** np.arange(-3, 3)
 
-    ### ========== TODO : START ========== ###
-    # part 2: select optimal hyperparameter using cross-validation
-    best_c = None
-    best_perf = float('-inf')
-    for c in C_range:
-        clf = SVC(kernel='linear', C=c)
-        perf = cv_performance(clf, X, y, kf, metric)
-        print(c, perf)
-        if perf > best_perf:
-            best_perf = perf
-            best_c = c
-
-    return best_c
-    ### ========== TODO : END ========== ###
+    # fit each (C, fold) pair once, in parallel, scoring every metric per fit
+    gs = GridSearchCV(LinearSVC(loss='hinge', dual=True), {'C': C_range}, cv=folds,
+                      scoring=partial(_multi_scorer, metric_list=metric_list),
+                      refit=False, n_jobs=-1)
+    gs.fit(X, y)
 
+    # cv_results_ follows the order of C_range
+    scores = dict((c, dict((metric, gs.cv_results_['mean_test_' + metric][i])
+                           for metric in metric_list))
+                  for i, c in enumerate(C_range))
+
+    optimal_c = dict()
+    for metric in metric_list:
+        print ('Linear SVM Hyperparameter Selection based on ' + str(metric) + ':')
+        best_c = None
+        best_perf = float('-inf')
+        for c in C_range:
+            perf = scores[c][metric]
+            print(c, perf)
+            if perf > best_perf:
+                best_perf = perf
+                best_c = c
+        optimal_c[metric] = best_c
 
+    return optimal_c
 
-def performance_test(clf, X, y, metric="accuracy"):
+
+def performance_test(clf, X, y, metric="accuracy", y_pred=None):
     """
     Estimates the performance of the classifier using the 95% CI.
 
     Parameters
     --------------------
-        clf          -- classifier (instance of SVC)
+        clf          -- classifier (instance of LinearSVC)
                           [already fit to data]
         X            -- numpy array of shape (n,d), feature vectors of test set
                           n = number of examples
                           d = number of features
         y            -- numpy array of shape (n,), binary labels {1,-1} of test set
         metric       -- string, option used to select performance measure
+        y_pred       -- numpy array of shape (n,), (continuous-valued) predictions
+                          of clf on X, if already computed
 
     Returns
     --------------------
@@ -249,7 +434,8 @@ def performance_test(clf, X, y, metric="accuracy"):
 
     ### ========== TODO : START ========== ###
     # part 3: return performance on test data by first computing predictions and then calling performance
-    y_pred = clf.decision_function(X)
+    if y_pred is None:
+        y_pred = fast_linear_decision(clf, X)
     score = performance(y, y_pred, metric)
     return score
     ### ========== TODO : END ========== ###
@@ -263,8 +449,7 @@ def main() :
     np.random.seed(1234)
 
     # read the tweets and its labels
-    dictionary = extract_dictionary('../data/tweets.txt')
-    X = extract_feature_vectors('../data/tweets.txt', dictionary)
+    dictionary, X = build_features('../data/tweets.txt')
     y = read_vector_file('../data/labels.txt')
 
     metric_list = ["accuracy", "f1_score", "auroc"]
@@ -277,19 +462,26 @@ def main() :
 
     # part 2: create stratified folds (5-fold CV)
     kf = StratifiedKFold(n_splits=5)
+    folds = list(kf.split(X_train, y_train))
 
     # part 2: for each metric, select optimal hyperparameter for linear-kernel SVM using CV
-    optimal_c = dict()
-    for metric in metric_list:
-        optimal_c[metric] = select_param_linear(X_train, y_train, kf, metric=metric)
+    optimal_c = select_param_linear_all(X_train, y_train, folds, metric_list)
     print(optimal_c)
     # part 3: train linear-kernel SVMs with selected hyperparameters
+    # (metrics that share an optimal C share one fit and one set of predictions)
+    classifiers = dict()
+    test_preds = dict()
+    for c in set(optimal_c.values()):
+        clf = LinearSVC(C=c, loss='hinge', dual=True)
+        clf.fit(X_train, y_train)
+        classifiers[c] = clf
+        test_preds[c] = fast_linear_decision(clf, X_test)
 
     # part 3: report performance on test data
     for metric in metric_list:
-        clf = SVC(kernel='linear', C=optimal_c[metric])
-        clf.fit(X_train, y_train)
-        print(metric, performance_test(clf, X_test, y_test, metric))
+        c = optimal_c[metric]
+        print(metric, performance_test(classifiers[c], X_test, y_test, metric,
+                                       y_pred=test_preds[c]))
 
 
     ### ========== TODO : END ========== ###